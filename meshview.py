@@ -1,16 +1,523 @@
+from io import BytesIO
+import os
+import tempfile
+
+import numpy as np
 import pandas as pd
 import streamlit as st
 
-from pkg import model
 from pkg import view
 
+# share column buffers on construction instead of copying eagerly
+pd.options.mode.copy_on_write = True
+
+
+def spill_df_pt(df: pd.DataFrame) -> str:
+    """
+    Write df to a parquet file and return its path
+
+    Keeping only the path in session_state bounds per-session RAM,
+    and the unique path doubles as a cheap cache key for everything
+    derived from the data
+
+    Parameters
+    --------
+    df : pd.DataFrame
+        user input data including the end of I and J point
+
+    Returns
+    --------
+    str
+        path of the parquet file
+    """
+    fd, path = tempfile.mkstemp(suffix='.parquet', prefix='meshview_')
+    os.close(fd)
+    df.to_parquet(path, compression='zstd')
+    return path
+
+
+@st.cache_resource(max_entries=2, show_spinner=False)
+def load_df_pt(
+    df_pt_path: str,
+    columns: tuple[str, ...] | None = None
+) -> pd.DataFrame:
+    """
+    Read back the spilled dataframe, loading only requested columns
+
+    Parameters
+    --------
+    df_pt_path : str
+        path of the parquet file
+    columns : tuple[str, ...] | None
+        column names to load, all columns if None
+
+    Returns
+    --------
+    pd.DataFrame
+    """
+    return pd.read_parquet(
+        df_pt_path,
+        columns=list(columns) if columns is not None else None
+    )
+
+
+@st.cache_resource(max_entries=2, show_spinner=False)
+def create_meshs(
+    df_pt_path: str,
+    col_v: str,
+    epsg: int | None
+) -> 'model.Meshs':
+    """
+    Create Meshs cached per (df_pt_path, col_v, epsg)
+
+    Rebuilding the mesh geometry is O(mesh count),
+    so reuse the instance while the inputs are unchanged
+
+    Parameters
+    --------
+    df_pt_path : str
+        path of the parquet file
+    col_v : str
+        column name of mesh value
+    epsg : int | None
+        EPSG code
+
+    Returns
+    --------
+    model.Meshs
+    """
+    from pkg import model
+    df = load_df_pt(df_pt_path)
+    return model.Meshs(df=df, col_v=col_v, epsg=epsg)
+
+
+@st.cache_data(show_spinner=False, max_entries=2)
+def compute_mesh_values(
+    df_pt_path: str,
+    _interior_mask: np.ndarray,
+    col_v: str,
+    dummy_v: float | None = None
+) -> np.ndarray:
+    """
+    Extract mesh values without the end of I and J point
+
+    Cached so that display-only reruns skip the column scans
+    The boundary mask is precomputed once on step confirmation
+
+    Parameters
+    --------
+    df_pt_path : str
+        path of the parquet file
+    _interior_mask : np.ndarray
+        boolean mask of rows without the end of I and J point,
+        aligned with the spilled row order (excluded from the cache key)
+    col_v : str
+        column name of mesh value
+    dummy_v : float | None
+        if v is dummy_v, the value will be removed
+
+    Returns
+    --------
+    np.ndarray
+        mesh values as 1-D array
+    """
+    df_pt = load_df_pt(df_pt_path, columns=(col_v,))
+    arr_v = df_pt[col_v].to_numpy()
+    mask = _interior_mask
+    if dummy_v:
+        mask = mask & (arr_v != dummy_v)
+    return arr_v[mask]
+
+
+@st.cache_resource(max_entries=2, show_spinner=False)
+def build_map(
+    df_pt_path: str,
+    col_v: str,
+    epsg: int | None,
+    dummy_v: float | None,
+    range_v: tuple[float, float] | None,
+    colorscale: str,
+    mesh_opacity: float,
+    zoom_level: int,
+    tile_index: int,
+    tile_opacity: float,
+    simplify: bool
+) -> 'go.Figure':
+    """
+    Build choropleth map figure, cached per inputs
+
+    Parameters
+    --------
+    df_pt_path : str
+        path of the parquet file
+    col_v : str
+        column name of mesh value
+    epsg : int | None
+        EPSG code
+    dummy_v : float | None
+        if v is dummy_v, the mesh will be removed from fig
+    range_v : tuple[float, float] | None
+        range of colorscale
+    colorscale : str
+        color scale name
+    mesh_opacity : float
+        mesh opacity
+    zoom_level : int
+        zoom level
+    tile_index : int
+        index in model.TILES
+    tile_opacity : float
+        tile opacity
+    simplify : bool
+        if True, merge cells falling in the same color bin
+
+    Returns
+    --------
+    go.Figure
+    """
+    from pkg import model
+    meshs = create_meshs(df_pt_path, col_v, epsg)
+    return meshs.choropleth_map(
+        dummy_v=dummy_v,
+        range_v=list(range_v) if range_v is not None else None,
+        colorscale=colorscale,
+        mesh_opacity=mesh_opacity,
+        zoom_level=zoom_level,
+        tile=model.TILES[tile_index],
+        tile_opacity=tile_opacity,
+        simplify=simplify
+    )
+
+
+@st.cache_resource(max_entries=2, show_spinner=False)
+def build_plot(
+    df_pt_path: str,
+    col_v: str,
+    epsg: int | None,
+    dummy_v: float | None,
+    range_v: tuple[float, float] | None,
+    cmap: str
+) -> 'Figure':
+    """
+    Build plot figure, cached per inputs
+
+    Parameters
+    --------
+    df_pt_path : str
+        path of the parquet file
+    col_v : str
+        column name of mesh value
+    epsg : int | None
+        EPSG code
+    dummy_v : float | None
+        if v is dummy_v, the mesh will be removed from fig
+    range_v : tuple[float, float] | None
+        [vmin, vmax] of colormap
+    cmap : str
+        colormap name
+
+    Returns
+    --------
+    Figure
+    """
+    meshs = create_meshs(df_pt_path, col_v, epsg)
+    return meshs.plot(
+        dummy_v=dummy_v,
+        range_v=list(range_v) if range_v is not None else None,
+        cmap=cmap
+    )
+
+
+@st.cache_data(show_spinner=False, max_entries=2)
+def zip_map_bytes(_meshs, _fig, cache_key: tuple) -> bytes:
+    """
+    Zip choropleth map to html, memoized on cache_key
+
+    Parameters
+    --------
+    _meshs : model.Meshs
+        mesh data (excluded from the cache key)
+    _fig : go.Figure
+        returned figure from choropleth_map (excluded from the cache key)
+    cache_key : tuple
+        hashable values which determine _fig
+
+    Returns
+    --------
+    bytes
+    """
+    return _meshs.zip_map(_fig).getvalue()
+
+
+@st.cache_data(show_spinner=False, max_entries=2)
+def zip_plot_bytes(_meshs, _fig, cache_key: tuple) -> bytes:
+    """
+    Zip plot to image, memoized on cache_key
+
+    Parameters
+    --------
+    _meshs : model.Meshs
+        mesh data (excluded from the cache key)
+    _fig : Figure
+        returned figure from plot (excluded from the cache key)
+    cache_key : tuple
+        hashable values which determine _fig and the extension
+
+    Returns
+    --------
+    bytes
+    """
+    ext = cache_key[-1]
+    return _meshs.zip_plot(_fig, ext).getvalue()
+
+
+@st.cache_data(show_spinner=False, max_entries=2)
+def zip_gis_bytes(_meshs, cache_key: tuple) -> bytes:
+    """
+    Zip GIS file, memoized on cache_key
+
+    Parameters
+    --------
+    _meshs : model.Meshs
+        mesh data (excluded from the cache key)
+    cache_key : tuple
+        hashable values which determine the output
+
+    Returns
+    --------
+    bytes
+    """
+    driver, ext = cache_key[-2], cache_key[-1]
+    return _meshs.zip_gis(driver, ext).getvalue()
+
+
+@st.cache_resource(show_spinner=False)
+def make_column_config(col_v: str) -> dict:
+    """
+    Make column config for st.data_editor, built once per col_v
+
+    Parameters
+    --------
+    col_v : str
+        column name of mesh value
+
+    Returns
+    --------
+    dict
+        column config of I, J, X, Y, col_v
+    """
+    return {
+        'I': st.column_config.NumberColumn(
+            label='I番号',
+            disabled=True
+        ),
+        'J': st.column_config.NumberColumn(
+            label='J番号',
+            disabled=True
+        ),
+        'X': st.column_config.NumberColumn(
+            label='X座標',
+            disabled=False,
+            default=0.0,
+            format='%.6g'
+        ),
+        'Y': st.column_config.NumberColumn(
+            label='Y座標',
+            disabled=False,
+            default=0.0,
+            format='%.6g'
+        ),
+        col_v: st.column_config.NumberColumn(
+            label=f'{col_v}',
+            disabled=False,
+            default=0.0,
+            format='%.6g'
+        )
+    }
+
+
+@st.cache_data(show_spinner=False, max_entries=2)
+def read_upload(
+    file_bytes: bytes,
+    delimit: str,
+    num_header: int,
+    usecols: list[int],
+    col_v: str
+) -> pd.DataFrame:
+    """
+    Read uploaded file as mesh dataframe
+
+    Try the native pyarrow.csv reader first, which parses only the
+    requested columns multi-threaded in C++, and fall back to the
+    pandas C engine when pyarrow cannot handle the file
+    Memoized on the file content and the read options, so reruns with
+    an unchanged upload skip the parse entirely
+
+    Parameters
+    --------
+    file_bytes : bytes
+        content of the uploaded file
+    delimit : str
+        delimiter
+    num_header : int
+        count of header rows
+    usecols : list[int]
+        0-based column numbers of I, J, X, Y, value
+    col_v : str
+        column name of mesh value
+
+    Returns
+    --------
+    pd.DataFrame
+        columns are 'I', 'J', 'X', 'Y', col_v
+    """
+    names = ['I', 'J', 'X', 'Y', col_v]
+    dtype = {
+        'I': 'int32',
+        'J': 'int32',
+        'X': float,
+        'Y': float,
+        col_v: float
+    }
+    header = num_header - 1 if num_header > 0 else None
+
+    try:
+        import pyarrow as pa
+        from pyarrow import csv as pa_csv
+
+        include_columns = [f'f{ncol}' for ncol in usecols]
+        column_types = dict(zip(
+            include_columns,
+            [pa.int32(), pa.int32(), pa.float64(), pa.float64(), pa.float64()]
+        ))
+        table = pa_csv.read_csv(
+            BytesIO(file_bytes),
+            read_options=pa_csv.ReadOptions(
+                skip_rows=num_header,
+                autogenerate_column_names=True
+            ),
+            parse_options=pa_csv.ParseOptions(delimiter=delimit),
+            convert_options=pa_csv.ConvertOptions(
+                include_columns=include_columns,
+                column_types=column_types
+            )
+        )
+        df_upload = table.to_pandas(self_destruct=True)
+        df_upload.columns = names
+    except (ImportError, ValueError, KeyError):
+        df_upload = pd.read_csv(
+            BytesIO(file_bytes),
+            sep=delimit,
+            header=header,
+            names=names,
+            usecols=usecols,
+            dtype=dtype,
+            skipinitialspace=True
+        )
+    return df_upload
+
+
+@st.cache_data(show_spinner=False, max_entries=2)
+def compute_v_range(
+    df_pt_path: str,
+    _interior_mask: np.ndarray,
+    col_v: str,
+    dummy_v: float | None = None
+) -> tuple[float, float]:
+    """
+    Compute min and max of mesh values
+
+    Cached per inputs so that display-only reruns scan nothing
+
+    Parameters
+    --------
+    df_pt_path : str
+        path of the parquet file
+    _interior_mask : np.ndarray
+        boolean mask of rows without the end of I and J point
+        (excluded from the cache key)
+    col_v : str
+        column name of mesh value
+    dummy_v : float | None
+        if v is dummy_v, the value will be removed
+
+    Returns
+    --------
+    tuple[float, float]
+        (min_v, max_v), (nan, nan) if no value remains
+    """
+    values_v = compute_mesh_values(
+        df_pt_path=df_pt_path,
+        _interior_mask=_interior_mask,
+        col_v=col_v,
+        dummy_v=dummy_v
+    )
+    if values_v.size > 0:
+        return float(np.nanmin(values_v)), float(np.nanmax(values_v))
+    return float('nan'), float('nan')
+
+
+def check_upload_ij(
+    df_upload: pd.DataFrame,
+    ij_manual: np.ndarray,
+    cnt_i: int,
+    cnt_j: int,
+    ij_start: int
+) -> bool:
+    """
+    Check uploaded I/J numbers against the expected grid
+
+    Cheap O(N) prechecks (length, bounds, histogram) reject wrong
+    uploads before the sorted full compare
+
+    Parameters
+    --------
+    df_upload : pd.DataFrame
+        uploaded data with 'I' and 'J' columns
+    ij_manual : np.ndarray
+        expected (num_rows, 2) I/J grid sorted by I then J
+    cnt_i : int
+        count of I based on point
+    cnt_j : int
+        count of J based on point
+    ij_start : int
+        start number of IJ
+
+    Returns
+    --------
+    True if uploaded I/J matches the grid else False
+    """
+    if len(df_upload) != cnt_i * cnt_j:
+        return False
+
+    arr_i = df_upload['I'].to_numpy()
+    arr_j = df_upload['J'].to_numpy()
+    if arr_i.min() != ij_start or arr_i.max() != cnt_i + ij_start - 1:
+        return False
+    if arr_j.min() != ij_start or arr_j.max() != cnt_j + ij_start - 1:
+        return False
+
+    # each I must appear cnt_j times, each J cnt_i times
+    if np.bincount(arr_i - ij_start).min() != cnt_j:
+        return False
+    if np.bincount(arr_j - ij_start).min() != cnt_i:
+        return False
+
+    ij_upload = np.stack([arr_i, arr_j], axis=1)
+    ij_upload = ij_upload[np.lexsort((arr_j, arr_i))]
+    return np.array_equal(ij_upload, ij_manual)
+
 
 def callback_apply_edited_rows(
     key_data_editor: str,
-    key_target: str
+    key_target: str,
+    key_cols: str
 ) -> None:
     """
-    Apply edited rows to target dataframe
+    Apply edited rows to target array
+
+    The editor rows are positional, so edits go straight into the
+    backing NumPy buffer without pandas indexing
 
     Parameters
     --------
@@ -18,12 +525,51 @@ def callback_apply_edited_rows(
         specified key at st.data_editor
     key_target : str
         key in st.session_state
-        st.session_state[key_target] must be dataframe
+        st.session_state[key_target] must be (num_rows, num_cols) array
+    key_cols : str
+        key in st.session_state
+        st.session_state[key_cols] must be list of editable column names
+        in the same order as the columns of the target array
     """
     dict_edited_rows = st.session_state[key_data_editor]['edited_rows']
+    if not dict_edited_rows:
+        return
+
+    dict_edited_cols: dict[str, tuple[list[int], list[float]]] = {}
     for idx, dict_edited_row in dict_edited_rows.items():
         for col, val in dict_edited_row.items():
-            st.session_state[key_target].loc[idx, col] = val
+            rows, vals = dict_edited_cols.setdefault(col, ([], []))
+            rows.append(idx)
+            vals.append(np.nan if val is None else val)
+
+    arr = st.session_state[key_target]
+    cols = st.session_state[key_cols]
+    for col, (rows, vals) in dict_edited_cols.items():
+        arr[rows, cols.index(col)] = vals
+
+
+def build_df_manual() -> pd.DataFrame:
+    """
+    Build the manual-input frame from the session edit buffers
+
+    Called at render and again in the confirm callback, so the frame
+    always reflects edits applied earlier in the same rerun
+
+    Returns
+    --------
+    pd.DataFrame
+        columns are I, J and st.session_state['cols_manual_xyv']
+    """
+    ij_manual = st.session_state['ij_manual']
+    arr_xyv = st.session_state['arr_manual_xyv']
+    col_x, col_y, col_v = st.session_state['cols_manual_xyv']
+    return pd.DataFrame({
+        'I': ij_manual[:, 0],
+        'J': ij_manual[:, 1],
+        col_x: arr_xyv[:, 0],
+        col_y: arr_xyv[:, 1],
+        col_v: arr_xyv[:, 2]
+    })
 
 
 def callback_set_step_df(
@@ -31,7 +577,7 @@ def callback_set_step_df(
     key: str | None = None
 ) -> None:
     """
-    Switch step on this app and determine st.session_state['df_pt']
+    Switch step on this app and determine st.session_state['df_pt_path']
 
     Parameters
     --------
@@ -39,12 +585,35 @@ def callback_set_step_df(
         step number to set st.session_state['step']
     key : str | None
         key in st.ssesion_state
-        st.session_state[key] will be assigned to st.session_state['df_pt']
+        st.session_state[key] will be written to parquet and its path
+        will be assigned to st.session_state['df_pt_path']
     """
     st.session_state['step'] = step
+
+    if step == 2:
+        ij_start = st.session_state['ij_start']
+        st.session_state['max_i'] = st.session_state['cnt_i'] + ij_start - 1
+        st.session_state['max_j'] = st.session_state['cnt_j'] + ij_start - 1
+
     if key is not None:
-        st.session_state['df_pt'] = st.session_state[key]
-        del st.session_state[key]
+        if key == 'df_manual':
+            # when an editor commit and the confirm click land in the
+            # same rerun, the editor callback has just written into the
+            # buffers and the frame from the previous run is stale
+            st.session_state[key] = build_df_manual()
+        df = st.session_state.pop(key)
+
+        path_old = st.session_state.get('df_pt_path')
+        if path_old is not None and os.path.exists(path_old):
+            os.remove(path_old)
+
+        # canonicalize row order so downstream masks can rely on it
+        df = df.sort_values(['I', 'J'], ignore_index=True)
+        st.session_state['df_pt_path'] = spill_df_pt(df)
+        st.session_state['interior_mask'] = (
+            (df['I'].to_numpy() != st.session_state['max_i'])
+            & (df['J'].to_numpy() != st.session_state['max_j'])
+        )
 
 
 def callback_set_epsg() -> None:
@@ -153,8 +722,8 @@ def main():
         col_v = st.session_state['col_v']
         epsg = st.session_state['epsg']
 
-        max_i = cnt_i + ij_start - 1
-        max_j = cnt_j + ij_start - 1
+        max_i = st.session_state['max_i']
+        max_j = st.session_state['max_j']
 
         col1, col2 = st.columns(spec=[0.25, 0.75], border=True)
         with col1:
@@ -171,46 +740,30 @@ def main():
             tab_manual, tab_upload = st.tabs(tabs=['値入力で指定', 'ファイルで指定'])
 
             with tab_manual:
-                if 'df_manual' not in st.session_state:
+                if 'arr_manual_xyv' not in st.session_state:
                     num_rows = cnt_i * cnt_j
-                    data = {
-                        'I': sorted([i + ij_start for i in range(cnt_i)] * cnt_j),
-                        'J': [j + ij_start for j in range(cnt_j)] * cnt_i,
-                        'X': [0.0 for _ in range(num_rows)],
-                        'Y': [0.0 for _ in range(num_rows)],
-                        col_v: [0.0 for _ in range(num_rows)]
-                    }
-                    df = pd.DataFrame(data)
-                    st.session_state['df_manual'] = df
-
-                column_config = {
-                    'I': st.column_config.NumberColumn(
-                        label='I番号',
-                        disabled=True
-                    ),
-                    'J': st.column_config.NumberColumn(
-                        label='J番号',
-                        disabled=True
-                    ),
-                    'X': st.column_config.NumberColumn(
-                        label='X座標',
-                        disabled=False,
-                        default=0.0,
-                        format='localized'
-                    ),
-                    'Y': st.column_config.NumberColumn(
-                        label='Y座標',
-                        disabled=False,
-                        default=0.0,
-                        format='localized'
-                    ),
-                    col_v: st.column_config.NumberColumn(
-                        label=f'{col_v}',
-                        disabled=False,
-                        default=0.0,
-                        format='localized'
+                    st.session_state['ij_manual'] = np.stack(
+                        [
+                            np.repeat(
+                                np.arange(ij_start, ij_start + cnt_i, dtype=np.int32),
+                                cnt_j
+                            ),
+                            np.tile(
+                                np.arange(ij_start, ij_start + cnt_j, dtype=np.int32),
+                                cnt_i
+                            )
+                        ],
+                        axis=1
+                    )
+                    st.session_state['arr_manual_xyv'] = np.zeros(
+                        (num_rows, 3),
+                        dtype=np.float64
                     )
-                }
+                    st.session_state['cols_manual_xyv'] = ['X', 'Y', col_v]
+
+                st.session_state['df_manual'] = build_df_manual()
+
+                column_config = make_column_config(col_v)
 
                 st.markdown(f"""
                 :small[
@@ -225,7 +778,7 @@ def main():
                     num_rows='fixed',
                     key='edited_df_manual',
                     on_change=callback_apply_edited_rows,
-                    args=('edited_df_manual', 'df_manual')
+                    args=('edited_df_manual', 'arr_manual_xyv', 'cols_manual_xyv')
                 )
 
                 if st.button(
@@ -301,48 +854,67 @@ def main():
 
                 is_correct_ij = False
                 if uploaded_file is not None:
-                    try:
-                        df_upload = pd.read_csv(
-                            uploaded_file,
-                            sep=delimit,
-                            header=num_header - 1 if num_header > 0 else None,
-                            names=['I', 'J', 'X', 'Y', col_v],
-                            usecols=[ncol_i-1, ncol_j-1, ncol_x-1, ncol_y-1, ncol_v-1],
-                            dtype={
-                                'I': int,
-                                'J': int,
-                                'X': float,
-                                'Y': float,
-                                col_v: float
-                            },
-                            skipinitialspace=True
-                        )
-
-                        st.markdown(':small[読込結果]')
+                    fingerprint = (
+                        # file_id changes on every upload, so a
+                        # re-uploaded file with the same name and size
+                        # is still re-parsed
+                        uploaded_file.file_id,
+                        uploaded_file.name,
+                        uploaded_file.size,
+                        delimit,
+                        num_header,
+                        ncol_i, ncol_j, ncol_x, ncol_y, ncol_v
+                    )
+                    if st.session_state.get('upload_fingerprint') != fingerprint:
+                        st.session_state['upload_fingerprint'] = fingerprint
+                        st.session_state.pop('df_upload', None)
+                        st.session_state['is_correct_ij'] = False
+                        st.session_state['upload_error'] = None
                         try:
-                            is_correct_ij = all((
-                                st.session_state['df_manual'][['I', 'J']] \
-                                == df_upload[['I', 'J']].sort_values(['I', 'J'])
-                            ).all())
-                        except ValueError:
-                            is_correct_ij = False
-
-                        if is_correct_ij:
-                            st.dataframe(
-                                data=df_upload,
-                                hide_index=True
+                            df_upload = read_upload(
+                                uploaded_file.getvalue(),
+                                delimit=delimit,
+                                num_header=num_header,
+                                usecols=[ncol_i-1, ncol_j-1, ncol_x-1, ncol_y-1, ncol_v-1],
+                                col_v=col_v
+                            )
+                            is_correct_ij = check_upload_ij(
+                                df_upload=df_upload,
+                                ij_manual=st.session_state['ij_manual'],
+                                cnt_i=cnt_i,
+                                cnt_j=cnt_j,
+                                ij_start=ij_start
                             )
-                            st.session_state['df_upload'] = df_upload
-                        else:
-                            if not len(df_upload) == cnt_i * cnt_j:
-                                st.error('行数が正しくありません')
+                            st.session_state['is_correct_ij'] = is_correct_ij
+
+                            if is_correct_ij:
+                                st.session_state['df_upload'] = df_upload
+                            elif not len(df_upload) == cnt_i * cnt_j:
+                                st.session_state['upload_error'] = '行数が正しくありません'
                             else:
-                                st.error('IJ が正しくありません')
+                                st.session_state['upload_error'] = 'IJ が正しくありません'
+
+                        except pd.errors.ParserError:
+                            st.session_state['upload_error'] = 'データを読み込めません'
+                        except ValueError:
+                            st.session_state['upload_error'] = 'データを読み込めません'
+
+                    is_correct_ij = st.session_state['is_correct_ij']
 
-                    except pd.errors.ParserError:
-                        st.error('データを読み込めません')
-                    except ValueError:
-                        st.error('データを読み込めません')
+                    st.markdown(':small[読込結果]')
+                    if is_correct_ij:
+                        df_upload = st.session_state['df_upload']
+                        num_preview = 200
+                        st.dataframe(
+                            data=df_upload.head(num_preview),
+                            hide_index=True
+                        )
+                        if len(df_upload) > num_preview:
+                            st.caption(
+                                f'先頭 {num_preview} / {len(df_upload)} 行を表示しています'
+                            )
+                    else:
+                        st.error(st.session_state['upload_error'])
 
                 if st.button(
                     label='確定',
@@ -356,228 +928,303 @@ def main():
             st.caption(f'I = {max_i}, J = {max_j} のメッシュ属性値は無視されます')
 
     if st.session_state['step'] == 3:
+        # matplotlib / plotly / geopandas are needed from here on only
+        from pkg import model
+
         cnt_i = st.session_state['cnt_i']
         cnt_j = st.session_state['cnt_j']
         ij_start = st.session_state['ij_start']
         col_v = st.session_state['col_v']
         epsg = st.session_state['epsg']
 
-        max_i = cnt_i + ij_start - 1
-        max_j = cnt_j + ij_start - 1
+        max_i = st.session_state['max_i']
+        max_j = st.session_state['max_j']
 
-        col1, col2 = st.columns(spec=[0.25, 0.75], border=True)
-        with col1:
-            view.show_params(
-                cnt_i=cnt_i,
-                cnt_j=cnt_j,
-                ij_start=ij_start,
-                col_v=col_v,
-                epsg=epsg
-            )
-        with col2:
-            st.markdown(':memo: メッシュの表示設定')
+        @st.fragment
+        def fragment_mesh_view() -> None:
+            """
+            Display settings and mesh rendering
 
-            with st.container(border=True):
-                dummy_v = st.number_input(
-                    label=f':gray-background[{col_v}] ダミー値',
-                    value=None,
-                    format='%0.3f'
-                )
-            with st.container(border=True):
-                st.markdown(f':small[:gray-background[{col_v}] 表示レンジ]')
-                range_auto = st.toggle(
-                    label='自動',
-                    value=True
+            Fragment so that display-only widget interactions rerun
+            this block instead of the whole script
+            """
+            col1, col2 = st.columns(spec=[0.25, 0.75], border=True)
+            with col1:
+                view.show_params(
+                    cnt_i=cnt_i,
+                    cnt_j=cnt_j,
+                    ij_start=ij_start,
+                    col_v=col_v,
+                    epsg=epsg
                 )
+            with col2:
+                st.markdown(':memo: メッシュの表示設定')
 
-                df_v = st.session_state['df_pt']
-                df_v = df_v.loc[(df_v['I'] != max_i) & (df_v['J'] != max_j), [col_v]]
-                df_v = df_v.loc[df_v[col_v] != dummy_v] if dummy_v else df_v
-
-                if range_auto:
-                    max_v = df_v[col_v].max()
-                    min_v = df_v[col_v].min()
-                else:
-                    max_v = st.number_input(
-                        label='最大値',
-                        value=df_v[col_v].max(),
-                        format='%0.3f',
-                        disabled=range_auto
+                with st.container(border=True):
+                    dummy_v = st.number_input(
+                        label=f':gray-background[{col_v}] ダミー値',
+                        value=None,
+                        format='%0.3f'
                     )
-                    min_v = st.number_input(
-                        label='最小値',
-                        value=df_v[col_v].min(),
-                        format='%0.3f',
-                        disabled=range_auto
+                with st.container(border=True):
+                    st.markdown(f':small[:gray-background[{col_v}] 表示レンジ]')
+                    range_auto = st.toggle(
+                        label='自動',
+                        value=True
                     )
 
-                if (min_v < max_v):
-                    range_v = [min_v, max_v]
-                else:
-                    st.warning('レンジ設定が正しくありません')
-                    range_v = None
-                    range_auto = True
-
-            with st.container(border=True):
-                if epsg is not None:
-                    mesh_opacity = 1.0 - st.slider(
-                        label='透過率',
-                        min_value=0.0,
-                        max_value=1.0,
-                        value=0.3,
-                        step=0.1,
-                        format='%0.1f',
-                        key='_mesh_opacity'
+                    min_v, max_v = compute_v_range(
+                        df_pt_path=st.session_state['df_pt_path'],
+                        _interior_mask=st.session_state['interior_mask'],
+                        col_v=col_v,
+                        dummy_v=dummy_v
                     )
-                else:
-                    pass
 
-            with st.container(border=True):
-                if epsg is not None:
-                    col1, col2 = st.columns(spec=2, vertical_alignment='bottom')
-                    with col1:
-                        color = st.selectbox(
-                            label='カラースケール',
-                            options=model.COLORS_PLOTLY,
-                            index=model.COLORS_PLOTLY.index('Viridis')
+                    if not range_auto:
+                        max_v = st.number_input(
+                            label='最大値',
+                            value=max_v,
+                            format='%0.3f',
+                            disabled=range_auto
                         )
-                    with col2:
-                        reverse = st.toggle(label='反転')
-                    view.link_color_scales()
-                else:
-                    col1, col2 = st.columns(spec=2, vertical_alignment='bottom')
-                    with col1:
-                        color = st.selectbox(
-                            label='カラースケール',
-                            options=model.COLORS_MATPLOTLIB,
-                            index=model.COLORS_MATPLOTLIB.index('viridis')
+                        min_v = st.number_input(
+                            label='最小値',
+                            value=min_v,
+                            format='%0.3f',
+                            disabled=range_auto
                         )
-                    with col2:
-                        reverse = st.toggle(label='反転')
-                    view.link_colormaps()
 
-                color = f'{color}_r' if reverse else color
+                    if (min_v < max_v):
+                        range_v = [min_v, max_v]
+                    else:
+                        st.warning('レンジ設定が正しくありません')
+                        range_v = None
+                        range_auto = True
 
-        if epsg is not None:
-            with st.container(border=True):
-                st.markdown(':memo: ベースマップの表示設定')
+                with st.container(border=True):
+                    if epsg is not None:
+                        mesh_opacity = 1.0 - st.slider(
+                            label='透過率',
+                            min_value=0.0,
+                            max_value=1.0,
+                            value=0.3,
+                            step=0.1,
+                            format='%0.1f',
+                            key='_mesh_opacity'
+                        )
+                    else:
+                        pass
 
                 with st.container(border=True):
-                    tile = st.selectbox(
-                        label='種類',
-                        options=model.TILES,
-                        format_func=lambda tile: tile.name
-                    )
+                    if epsg is not None:
+                        col1, col2 = st.columns(spec=2, vertical_alignment='bottom')
+                        with col1:
+                            color = st.selectbox(
+                                label='カラースケール',
+                                options=model.colors_plotly(),
+                                index=model.colors_plotly().index('Viridis')
+                            )
+                        with col2:
+                            reverse = st.toggle(label='反転')
+                        view.link_color_scales()
+                    else:
+                        col1, col2 = st.columns(spec=2, vertical_alignment='bottom')
+                        with col1:
+                            color = st.selectbox(
+                                label='カラースケール',
+                                options=model.colors_matplotlib(),
+                                index=model.colors_matplotlib().index('viridis')
+                            )
+                        with col2:
+                            reverse = st.toggle(label='反転')
+                        view.link_colormaps()
 
+                    color = f'{color}_r' if reverse else color
+
+                simplify = False
+                if epsg is not None and (cnt_i - 1) * (cnt_j - 1) > 50_000:
+                    with st.container(border=True):
+                        simplify = st.toggle(
+                            label='簡略表示（同じ色帯のメッシュを結合）'
+                        )
+                        st.caption('メッシュ数が多い場合に地図表示を軽くします')
+
+            if epsg is not None:
                 with st.container(border=True):
-                    tile_opacity = 1.0 - st.slider(
-                        label='透過率',
-                        min_value=0.0,
-                        max_value=1.0,
-                        value=0.3,
-                        step=0.1,
-                        format='%0.1f',
-                        key='_tile_opacity'
+                    st.markdown(':memo: ベースマップの表示設定')
+
+                    with st.container(border=True):
+                        tile_index = st.selectbox(
+                            label='種類',
+                            options=range(len(model.TILES)),
+                            format_func=lambda idx: model.TILES[idx].name
+                        )
+
+                    with st.container(border=True):
+                        tile_opacity = 1.0 - st.slider(
+                            label='透過率',
+                            min_value=0.0,
+                            max_value=1.0,
+                            value=0.3,
+                            step=0.1,
+                            format='%0.1f',
+                            key='_tile_opacity'
+                        )
+                    with st.container(border=True):
+                        zoom_level = st.slider(
+                            label='ズームレベル',
+                            min_value=0,
+                            max_value=20,
+                            value=12,
+                            step=1
+                        )
+
+            meshs = create_meshs(
+                df_pt_path=st.session_state['df_pt_path'],
+                col_v=st.session_state['col_v'],
+                epsg=st.session_state['epsg']
+            )
+
+            with st.container(border=True):
+                st.markdown(':sparkles: メッシュ表示')
+                if epsg is not None:
+                    # Plotly plot
+                    fig = build_map(
+                        df_pt_path=st.session_state['df_pt_path'],
+                        col_v=col_v,
+                        epsg=epsg,
+                        dummy_v=dummy_v,
+                        range_v=tuple(range_v) if range_v is not None else None,
+                        colorscale=color,
+                        mesh_opacity=mesh_opacity,
+                        zoom_level=zoom_level,
+                        tile_index=tile_index,
+                        tile_opacity=tile_opacity,
+                        simplify=simplify
                     )
-                with st.container(border=True):
-                    zoom_level = st.slider(
-                        label='ズームレベル',
-                        min_value=0,
-                        max_value=20,
-                        value=12,
-                        step=1
+                    st.plotly_chart(
+                        fig,
+                        config={'scrollZoom': True}
                     )
 
-        meshs = model.Meshs(
-            df=st.session_state['df_pt'],
-            col_v=st.session_state['col_v'],
-            epsg=st.session_state['epsg']
-        )
+                    @st.fragment
+                    def download_map():
+                        st.markdown(':small[HTML データ]')
+                        cache_key = (
+                            st.session_state['df_pt_path'],
+                            dummy_v,
+                            str(range_v),
+                            color,
+                            mesh_opacity,
+                            zoom_level,
+                            tile_index,
+                            tile_opacity,
+                            simplify
+                        )
+                        if st.button(label='作成', key='make_map'):
+                            with st.spinner():
+                                st.session_state['zip_map'] = (
+                                    cache_key,
+                                    zip_map_bytes(meshs, fig, cache_key=cache_key)
+                                )
 
-        with st.container(border=True):
-            st.markdown(':sparkles: メッシュ表示')
-            if epsg is not None:
-                # Plotly plot
-                fig = meshs.choropleth_map(
-                    dummy_v=dummy_v,
-                    range_v=range_v,
-                    colorscale=color,
-                    mesh_opacity=mesh_opacity,
-                    zoom_level=zoom_level,
-                    tile=tile,
-                    tile_opacity=tile_opacity
-                )
-                st.plotly_chart(
-                    fig,
-                    config={'scrollZoom': True}
-                )
+                        zip_entry = st.session_state.get('zip_map')
+                        if zip_entry is not None and zip_entry[0] == cache_key:
+                            st.download_button(
+                                label='Download',
+                                data=zip_entry[1],
+                                file_name='map.zip',
+                                mime='application/zip'
+                            )
 
-                @st.fragment
-                def download_map():
-                    st.markdown(':small[HTML データ]')
-                    with st.spinner():
-                        st.download_button(
-                            label='Download',
-                            data=meshs.zip_map(fig),
-                            file_name='map.zip',
-                            mime='application/zip'
-                        )
+                else:
+                    # Matplotlib plot
+                    fig = build_plot(
+                        df_pt_path=st.session_state['df_pt_path'],
+                        col_v=col_v,
+                        epsg=epsg,
+                        dummy_v=dummy_v,
+                        range_v=tuple(range_v) if range_v is not None else None,
+                        cmap=color
+                    )
+                    st.pyplot(fig)
 
-            else:
-                # Matplotlib plot
-                fig = meshs.plot(
-                    dummy_v=dummy_v,
-                    range_v=range_v,
-                    cmap=color
-                )
-                st.pyplot(fig)
+                    @st.fragment
+                    def download_plot():
+                        col1, col2 = st.columns(spec=2, vertical_alignment='bottom')
+                        with col1:
+                            ext = st.selectbox(
+                                label='画像データ',
+                                options=model.EXT_PLOT
+                            )
+                        with col2:
+                            cache_key = (
+                                st.session_state['df_pt_path'],
+                                dummy_v,
+                                str(range_v),
+                                color,
+                                ext
+                            )
+                            if st.button(label='作成', key='make_plot'):
+                                with st.spinner():
+                                    st.session_state['zip_plot'] = (
+                                        cache_key,
+                                        zip_plot_bytes(
+                                            meshs,
+                                            fig,
+                                            cache_key=cache_key
+                                        )
+                                    )
+
+                            zip_entry = st.session_state.get('zip_plot')
+                            if zip_entry is not None and zip_entry[0] == cache_key:
+                                st.download_button(
+                                    label='Download',
+                                    data=zip_entry[1],
+                                    file_name='plot.zip',
+                                    mime='application/zip'
+                                )
+
+            with st.container(border=True):
+                st.markdown(':sparkles: ダウンロード')
 
                 @st.fragment
-                def download_plot():
+                def download_gis():
                     col1, col2 = st.columns(spec=2, vertical_alignment='bottom')
                     with col1:
-                        ext = st.selectbox(
-                            label='画像データ',
-                            options=model.EXT_PLOT
+                        driver = st.selectbox(
+                            label='GIS データ',
+                            options=model.DRIVER2EXT.keys()
                         )
+                        ext = model.DRIVER2EXT[driver]
                     with col2:
-                        with st.spinner():
+                        cache_key = (st.session_state['df_pt_path'], driver, ext)
+                        if st.button(label='作成', key='make_gis'):
+                            with st.spinner():
+                                st.session_state['zip_gis'] = (
+                                    cache_key,
+                                    zip_gis_bytes(meshs, cache_key=cache_key)
+                                )
+
+                        zip_entry = st.session_state.get('zip_gis')
+                        if zip_entry is not None and zip_entry[0] == cache_key:
                             st.download_button(
                                 label='Download',
-                                data=meshs.zip_plot(fig, ext),
-                                file_name='plot.zip',
+                                data=zip_entry[1],
+                                file_name='mesh.zip',
                                 mime='application/zip'
                             )
 
-        with st.container(border=True):
-            st.markdown(':sparkles: ダウンロード')
-
-            @st.fragment
-            def download_gis():
-                col1, col2 = st.columns(spec=2, vertical_alignment='bottom')
-                with col1:
-                    driver = st.selectbox(
-                        label='GIS データ',
-                        options=model.DRIVER2EXT.keys()
-                    )
-                    ext = model.DRIVER2EXT[driver]
-                with col2:
-                    with st.spinner():
-                        st.download_button(
-                            label='Download',
-                            data=meshs.zip_gis(driver, ext),
-                            file_name='mesh.zip',
-                            mime='application/zip'
-                        )
+                with st.container(border=True):
+                    download_gis()
 
-            with st.container(border=True):
-                download_gis()
+                with st.container(border=True):
+                    if epsg is not None:
+                        download_map()
+                    else:
+                        download_plot()
 
-            with st.container(border=True):
-                if epsg is not None:
-                    download_map()
-                else:
-                    download_plot()
+        fragment_mesh_view()
 
     st.markdown("""
     * ブラウザ更新でリセットできます
@@ -1,5 +1,7 @@
 import dataclasses
+import functools
 import glob
+import json
 from io import BytesIO
 import os.path
 import tempfile
@@ -8,29 +10,46 @@ import zipfile
 
 import geopandas as gpd
 import matplotlib.pyplot as plt
+from matplotlib.collections import PolyCollection
 from matplotlib.figure import Figure
-from matplotlib import colormaps
 from mpl_toolkits.axes_grid1 import make_axes_locatable
+import numpy as np
 import pandas as pd
-import plotly.express as px
 import plotly.graph_objects as go
-from _plotly_utils import colors
-from shapely.geometry import Polygon
+from pyproj import Transformer
+import shapely
 
 
-COLORS_PLOTLY = sorted(
-    [s for s in dir(colors.sequential) if ('_' not in s) and (not s.startswith('swatches'))],
-    key=str.lower
-)
-COLORS_MATPLOTLIB = sorted(
-    [s for s in colormaps if not s.endswith('_r')],
-    key=str.lower
-)
+@functools.cache
+def colors_plotly() -> tuple[str, ...]:
+    """
+    Sequential color scale names of plotly
+    Computed on first use to keep import light
+    """
+    from _plotly_utils import colors
+    return tuple(sorted(
+        [s for s in dir(colors.sequential) if ('_' not in s) and (not s.startswith('swatches'))],
+        key=str.lower
+    ))
 
+
+@functools.cache
+def colors_matplotlib() -> tuple[str, ...]:
+    """
+    Colormap names of matplotlib
+    Computed on first use to keep import light
+    """
+    from matplotlib import colormaps
+    return tuple(sorted(
+        [s for s in colormaps if not s.endswith('_r')],
+        key=str.lower
+    ))
+
+# single-file formats first: they export fastest and default in the UI
 DRIVER2EXT = {
-    'ESRI Shapefile': 'shp',
+    'GPKG': 'gpkg',
     'GeoJSON': 'geojson',
-    'GPKG': 'gpkg'
+    'ESRI Shapefile': 'shp'
 }
 EXT_PLOT = ['png', 'pdf', 'svg']
 EXT_MAP = ['png', 'svg', 'html']
@@ -112,41 +131,84 @@ class Meshs:
         self.col_v = col_v
         self.epsg = epsg
         self.gdf: gpd.GeoDataFrame
+        self._wgs84_cache: dict[
+            tuple, tuple[gpd.GeoDataFrame, dict, tuple[float, float, float, float]]
+        ] = {}
         self.set_gdf(df)
 
     def set_gdf(self, df: pd.DataFrame) -> None:
         """
         Set GeoDataFrame
 
+        The grid is regular, so the four cell corners come from view
+        slices of the (cnt_i, cnt_j) coordinate matrices instead of
+        shifted copies of the dataframe
+
         Parameters
         --------
         df : pd.DataFrame
             user input data including the end of I and J point
             columns are col_i, col_j, col_x, col_y, col_v
         """
+        cnt_i = df[self.col_i].nunique()
         cnt_j = df[self.col_j].nunique()
-        max_i = df[self.col_i].max()
-        max_j = df[self.col_j].max()
-        df = df.sort_values([self.col_i, self.col_j])
-        df[['Xpt2', 'Ypt2']] = df.loc[:, [self.col_x, self.col_y]].shift(-1)
-        df[['Xpt3', 'Ypt3']] = df.loc[:, [self.col_x, self.col_y]].shift(-cnt_j - 1)
-        df[['Xpt4', 'Ypt4']] = df.loc[:, [self.col_x, self.col_y]].shift(-cnt_j)
-
-        df = df.loc[(df[self.col_i] != max_i) & (df[self.col_j] != max_j), :]
-
-        def getpolygon(row):
-            x1, y1 = row[self.col_x], row[self.col_y]
-            x2, y2 = row['Xpt2'], row['Ypt2']
-            x3, y3 = row['Xpt3'], row['Ypt3']
-            x4, y4 = row['Xpt4'], row['Ypt4']
-            polygon = Polygon([(x1, y1), (x2, y2), (x3, y3), (x4, y4)])
-            return polygon
-
-        df['geometry'] = df.apply(getpolygon, axis=1)  # type: ignore
-
-        df = df[[self.col_i, self.col_j, self.col_v, 'geometry']]
-        gdf = gpd.GeoDataFrame(df, crs=self.epsg)
+
+        # the app spills the frame already sorted, so one O(N) pass over
+        # an encoded (I, J) key usually saves the O(N log N) sort
+        arr_i = df[self.col_i].to_numpy(dtype=np.int64)
+        arr_j = df[self.col_j].to_numpy(dtype=np.int64)
+        code = arr_i * (arr_j.max() + 1) + arr_j
+        if not np.all(np.diff(code) > 0):
+            df = df.sort_values([self.col_i, self.col_j])
+
+        arr_x = df[self.col_x].to_numpy().reshape(cnt_i, cnt_j)
+        arr_y = df[self.col_y].to_numpy().reshape(cnt_i, cnt_j)
+
+        xs = np.stack(
+            [
+                arr_x[:-1, :-1].ravel(),
+                arr_x[:-1, 1:].ravel(),
+                arr_x[1:, 1:].ravel(),
+                arr_x[1:, :-1].ravel()
+            ],
+            axis=1
+        )
+        ys = np.stack(
+            [
+                arr_y[:-1, :-1].ravel(),
+                arr_y[:-1, 1:].ravel(),
+                arr_y[1:, 1:].ravel(),
+                arr_y[1:, :-1].ravel()
+            ],
+            axis=1
+        )
+        verts = np.stack([xs, ys], axis=-1)
+        # kept for plot(), which renders the (N, 4, 2) array directly;
+        # float32 is plenty for screen pixels and halves the footprint,
+        # while the shapely geometries below stay float64 for CRS work
+        self._verts = verts.astype(np.float32)
+        # batched construction (shapely >= 2, required by geopandas >= 1)
+        # instead of one Polygon() call per row
+        geometry = shapely.polygons(verts)
+
+        # native-CRS extent as plain numpy reductions,
+        # spares a GEOS envelope scan per figure build
+        self._bounds = (arr_x.min(), arr_y.min(), arr_x.max(), arr_y.max())
+
+        def interior(col: str) -> np.ndarray:
+            return df[col].to_numpy().reshape(cnt_i, cnt_j)[:-1, :-1].ravel()
+
+        gdf = gpd.GeoDataFrame(
+            {
+                self.col_i: interior(self.col_i),
+                self.col_j: interior(self.col_j),
+                self.col_v: interior(self.col_v),
+                'geometry': geometry
+            },
+            crs=self.epsg
+        )
         self.gdf = gdf
+        self._wgs84_cache = {}
 
     def choropleth_map(
         self,
@@ -156,7 +218,8 @@ class Meshs:
         mesh_opacity: float,
         zoom_level: int,
         tile: TILE,
-        tile_opacity: float
+        tile_opacity: float,
+        simplify: bool = False
     ) -> go.Figure:
         """
         Choropleth map based on plotly
@@ -167,17 +230,20 @@ class Meshs:
         dummy_v : float | None
             if v is dummy_v, the mesh will be removed from fig
         range_v : list[float] | None
-            range_color to be passed to px.choropleth_map
+            [zmin, zmax] to be passed to go.Choroplethmap
         colorscale : str
-            color_continuous_scale to be passed to px.choropleth_map
+            colorscale to be passed to go.Choroplethmap
         mesh_opacity : float
-            opacity to be passed to px.choropleth_map
+            marker_opacity to be passed to go.Choroplethmap
         zoom_level : int
-            zoom to be passed to px.choropleth_map
+            map zoom level
         tile : TILE
             basemap
         tile_opacity : float
             tile opacity
+        simplify : bool
+            if True, merge cells falling in the same color bin
+            so the browser draws far fewer polygons
 
         Returns
         --------
@@ -185,35 +251,73 @@ class Meshs:
         """
         col_ij = 'IJ'
 
-        if dummy_v is not None:
-            gdf = self.gdf.loc[self.gdf[self.col_v] != dummy_v].copy()
-        else:
-            gdf = self.gdf.copy()
+        # reprojecting every polygon through pyproj is the hot path,
+        # so keep the WGS84 frame until set_gdf replaces the mesh
+        key = (self.epsg, dummy_v, simplify)
+        if key not in self._wgs84_cache:
+            if dummy_v is not None:
+                gdf = self.gdf.loc[self.gdf[self.col_v] != dummy_v]
+            else:
+                gdf = self.gdf
+
+            if simplify:
+                bins = pd.cut(gdf[self.col_v], bins=32, labels=False)
+                gdf = gdf[[self.col_v, 'geometry']].dissolve(
+                    by=bins.rename(col_ij),
+                    aggfunc='mean'
+                )
+            else:
+                ij = gdf[self.col_i].astype(str).str.cat(
+                    gdf[self.col_j].astype(str),
+                    sep=', '
+                )
+                gdf = gdf[[self.col_v, 'geometry']].set_index(ij.rename(col_ij))
 
-        gdf[col_ij] = gdf.apply(
-            lambda row: f"{row[self.col_i]}, {row[self.col_j]}",
-            axis=1
-        )
-        gdf = gdf[[col_ij, self.col_v, 'geometry']].set_index(col_ij)
-
-        gdf = gdf.to_crs(4326)  # WGS84
-        minx, miny, maxx, maxy = gdf['geometry'].total_bounds
-
-        fig = px.choropleth_map(
-            data_frame=gdf,
-            geojson=gdf.geometry,
-            locations=gdf.index,
-            color=self.col_v,
-            color_continuous_scale=colorscale,
-            range_color=range_v,
-            hover_data=[self.col_v],
-            opacity=mesh_opacity,
-            zoom=zoom_level,
-            center=dict(
-                lat=(miny + maxy)/2,
-                lon=(minx + maxx)/2
-                ),
-            height=720
+            gdf = gdf.to_crs(4326)  # WGS84
+
+            # one batched C serialization and a single json.loads
+            # instead of per-polygon __geo_interface__ trips in plotly
+            geoms = json.loads(
+                '[%s]' % ','.join(shapely.to_geojson(gdf['geometry'].to_numpy()))
+            )
+            geojson = {
+                'type': 'FeatureCollection',
+                'features': [
+                    {'type': 'Feature', 'id': ij, 'geometry': geom}
+                    for ij, geom in zip(gdf.index, geoms)
+                ]
+            }
+
+            # map center from the two native-CRS corner points instead
+            # of total_bounds over every reprojected polygon
+            transformer = Transformer.from_crs(self.epsg, 4326, always_xy=True)
+            lons, lats = transformer.transform(
+                (self._bounds[0], self._bounds[2]),
+                (self._bounds[1], self._bounds[3])
+            )
+            bounds = (lons[0], lats[0], lons[1], lats[1])
+
+            self._wgs84_cache[key] = (gdf, geojson, bounds)
+
+        gdf, geojson, (minx, miny, maxx, maxy) = self._wgs84_cache[key]
+
+        # go.Choroplethmap takes the cached dict as is, skipping the
+        # per-figure data tidying of plotly express
+        fig = go.Figure(
+            data=go.Choroplethmap(
+                geojson=geojson,
+                locations=gdf.index,
+                z=gdf[self.col_v],
+                colorscale=colorscale,
+                zmin=range_v[0] if range_v is not None else None,
+                zmax=range_v[1] if range_v is not None else None,
+                marker_opacity=mesh_opacity,
+                colorbar_title_text=self.col_v,
+                hovertemplate=(
+                    f'{col_ij}=%{{location}}<br>'
+                    f'{self.col_v}=%{{z}}<extra></extra>'
+                )
+            )
         )
 
         map_layers = [
@@ -227,8 +331,16 @@ class Meshs:
         ]
 
         fig.update_layout(
-            map_style='white-bg',
-            map_layers=map_layers
+            map=dict(
+                style='white-bg',
+                center=dict(
+                    lat=(miny + maxy)/2,
+                    lon=(minx + maxx)/2
+                ),
+                zoom=zoom_level,
+                layers=map_layers
+            ),
+            height=720
         )
 
         return fig
@@ -256,10 +368,13 @@ class Meshs:
         --------
         Figure
         """
+        values = self.gdf[self.col_v].to_numpy()
         if dummy_v is not None:
-            gdf = self.gdf.loc[self.gdf[self.col_v] != dummy_v].copy()
+            mask = values != dummy_v
+            verts = self._verts[mask]
+            values = values[mask]
         else:
-            gdf = self.gdf.copy()
+            verts = self._verts
 
         fig, ax = plt.subplots(tight_layout=True)
 
@@ -269,15 +384,21 @@ class Meshs:
         ax.grid(linewidth=0.5)
         ax.set_axisbelow(True)
 
-        gdf.plot(
-            column=self.col_v,
-            cmap=cmap,
-            ax=ax,
-            legend=True,
-            legend_kwds={'label': self.col_v, 'cax': cax},
-            vmin=range_v[0] if range_v is not None else None,
-            vmax=range_v[1] if range_v is not None else None
-        )
+        if values.size == 0:
+            # every cell filtered out by dummy_v; warn like gdf.plot
+            # did for an empty frame instead of crashing
+            warnings.warn('The mesh to plot is empty. Nothing has been displayed.')
+            return fig
+
+        # feed the vertex array straight to matplotlib instead of
+        # re-extracting coordinates from shapely via gdf.plot
+        collection = PolyCollection(verts=verts, array=values, cmap=cmap)
+        if range_v is not None:
+            collection.set_clim(range_v[0], range_v[1])
+        ax.add_collection(collection)
+        ax.set_aspect('equal')
+        ax.autoscale_view()
+        fig.colorbar(mappable=collection, cax=cax, label=self.col_v)
 
         return fig
 
@@ -303,19 +424,20 @@ class Meshs:
         in_memory = BytesIO()
         filename = 'plot'
 
-        with tempfile.TemporaryDirectory() as tmpdir:
-            with zipfile.ZipFile(
-                file=in_memory,
-                mode='w',
-                compression=zipfile.ZIP_DEFLATED
-            ) as zf:
+        buf = BytesIO()
+        fig.savefig(fname=buf, format=ext)
 
-                filepath = os.path.join(tmpdir, f'{filename}.{ext}')
-                fig.savefig(fname=filepath)
-                zf.write(
-                    filename=filepath,
-                    arcname=os.path.basename(filepath)
-                )
+        # png and pdf are already compressed; deflate only helps svg
+        with zipfile.ZipFile(
+            file=in_memory,
+            mode='w',
+            compression=zipfile.ZIP_DEFLATED if ext == 'svg' else zipfile.ZIP_STORED
+        ) as zf:
+
+            zf.writestr(
+                zinfo_or_arcname=f'{filename}.{ext}',
+                data=buf.getvalue()
+            )
 
         return in_memory
 
@@ -338,10 +460,13 @@ class Meshs:
         in_memory = BytesIO()
         filename = 'map'
 
+        # the html is large but highly redundant; level 1 gets most of
+        # the size win at a fraction of the zlib time
         with zipfile.ZipFile(
             file=in_memory,
             mode='w',
-            compression=zipfile.ZIP_DEFLATED
+            compression=zipfile.ZIP_DEFLATED,
+            compresslevel=1
         ) as zf:
 
             fig_bytes = fig.to_html()
@@ -392,9 +517,13 @@ class Meshs:
                         driver=driver
                     )
 
-                files = glob.glob(
-                    pathname=os.path.join(tmpdir, f'{filename}.*')
-                )
+                if driver == 'ESRI Shapefile':
+                    # shapefile comes with sidecar files
+                    files = glob.glob(
+                        pathname=os.path.join(tmpdir, f'{filename}.*')
+                    )
+                else:
+                    files = [filepath]
 
                 for file in files:
                     zf.write(
@@ -1,3 +1,5 @@
+import functools
+
 from pyproj import CRS
 from pyproj import exceptions
 import streamlit as st
@@ -40,6 +42,30 @@ def link_colormaps() -> None:
     )
 
 
+@functools.lru_cache(maxsize=128)
+def crs_name(epsg: int) -> str | None:
+    """
+    Resolve crs name
+
+    Memoized because pyproj looks up its database on every call;
+    a plain lru_cache is enough for a str and skips the pickling
+    of st.cache_data
+
+    Parameters
+    --------
+    epsg : int
+        EPSG code
+
+    Returns
+    --------
+    crs name if valid epsg else None
+    """
+    try:
+        return CRS.from_epsg(epsg).name
+    except exceptions.CRSError:
+        return None
+
+
 def caption_crs_name(epsg: int | None) -> bool:
     """
     Caption crs name
@@ -48,7 +74,7 @@ def caption_crs_name(epsg: int | None) -> bool:
     --------
     epsg : int
         EPSG code
-    
+
     Returns
     --------
     True if valid epsg else False
@@ -57,13 +83,13 @@ def caption_crs_name(epsg: int | None) -> bool:
         st.caption('座標系: :gray-background[指定なし]')
         return False
 
-    try:
-        crs = CRS.from_epsg(epsg)
-        st.caption(f"座標系: :gray-background[{crs.name}]")
+    name = crs_name(epsg)
+    if name is not None:
+        st.caption(f"座標系: :gray-background[{name}]")
         return True
-    except exceptions.CRSError:
-        st.caption('座標系: :gray-background[該当なし]')
-        return False
+
+    st.caption('座標系: :gray-background[該当なし]')
+    return False
 
 
 def show_params(